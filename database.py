@@ -3,9 +3,10 @@ Database Helper Functions
 
 MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
+The client is Motor's AsyncIOMotorClient, so helpers are coroutines and must be awaited.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
@@ -22,12 +23,44 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    _client = AsyncIOMotorClient(database_url)
     db = _client[database_name]
 
+def to_bson_precision(value: datetime) -> datetime:
+    """Drop sub-millisecond digits, which BSON datetimes cannot store"""
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def utc_now() -> datetime:
+    """Current UTC time at the precision Mongo stores, so echoes match reads"""
+    return to_bson_precision(datetime.now(timezone.utc))
+
+
+async def ensure_indexes():
+    """Create the indexes the API queries rely on (no-op when already present)"""
+    if db is None:
+        return
+    # history: equality on vehicle_id, range/sort on occurred_at
+    await db["event"].create_index([("vehicle_id", 1), ("occurred_at", 1)])
+    await db["vehicle"].create_index("status")
+    # VINs may be missing, null or empty (raw sync dicts are stored as sent), so
+    # only enforce uniqueness on documents carrying a non-empty string VIN;
+    # sparse=True would still index explicit nulls
+    await db["vehicle"].create_index(
+        "vin",
+        unique=True,
+        partialFilterExpression={"vin": {"$type": "string", "$gt": ""}},
+    )
+
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
-    """Insert a single document with timestamp"""
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
+    """Insert a single document with timestamp
+
+    A dict is stamped and inserted as-is rather than copied, so afterwards it
+    holds created_at, updated_at and the new ``_id`` and can be echoed back
+    without re-reading it. Timestamps already present on ``data`` are kept.
+    Returns the inserted ``_id`` as an ObjectId.
+    """
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
 
@@ -35,21 +68,23 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     if isinstance(data, BaseModel):
         data_dict = data.model_dump()
     else:
-        data_dict = data.copy()
+        data_dict = data
 
-    data_dict['created_at'] = datetime.now(timezone.utc)
-    data_dict['updated_at'] = datetime.now(timezone.utc)
+    now = utc_now()
+    data_dict.setdefault('created_at', now)
+    data_dict.setdefault('updated_at', now)
 
-    result = db[collection_name].insert_one(data_dict)
-    return str(result.inserted_id)
+    result = await db[collection_name].insert_one(data_dict)
+    return result.inserted_id
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, projection: dict = None):
+    """Get documents from collection, optionally restricted to the fields in ``projection``"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
-    cursor = db[collection_name].find(filter_dict or {})
+    cursor = db[collection_name].find(filter_dict or {}, projection)
     if limit:
-        cursor = cursor.limit(limit)
+        # fetch the whole page in a single batch
+        cursor = cursor.limit(limit).batch_size(limit)
     
-    return list(cursor)
+    return await cursor.to_list(length=limit)
@@ -1,26 +1,82 @@
+import logging
 import os
-from typing import List, Optional, Dict, Any
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional, Dict, Any, Set, Tuple
 from datetime import datetime, timezone
+from operator import itemgetter
 
-from fastapi import FastAPI, HTTPException, Query
+import orjson
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.openapi.constants import REF_PREFIX
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
-from database import db, create_document, get_documents
+from database import db, create_document, ensure_indexes, get_documents, to_bson_precision, utc_now
+from schemas import Mutation
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
-app = FastAPI(title="BMW ELV Tracking API", version="0.1.0")
+logger = logging.getLogger(__name__)
+
+
+class UTCJSONResponse(ORJSONResponse):
+    """ORJSONResponse that writes naive and UTC datetimes with a ``Z`` suffix.
+
+    Mongo hands datetimes back naive (but in UTC) and OPT_NAIVE_UTC treats them
+    as such; OPT_UTC_Z only rewrites a ``+00:00`` offset, so handlers convert any
+    other aware datetime to UTC before storing and echoing it.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z,
+        )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # indexes are an optimisation: an unreachable database or existing duplicate
+    # VINs must not keep the API from starting (/test reports that state)
+    try:
+        await ensure_indexes()
+    except Exception:
+        logger.exception("Could not create database indexes")
+    yield
+
+
+app = FastAPI(
+    title="BMW ELV Tracking API",
+    version="0.1.0",
+    default_response_class=UTCJSONResponse,
+    lifespan=lifespan,
+)
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    # the gain here is max_age: browsers cache preflights for a day. The explicit
+    # lists restrict what clients may send; they are not faster than "*" (with
+    # "*" Starlette just echoes the requested headers, while a list is checked
+    # header by header)
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type", "authorization", "x-client-id"],
+    max_age=86400,
 )
 
 
 # ---------- Helpers ----------
+# fields returned by the history timeline unless the client asks for others
+HISTORY_FIELDS = {"event_type": 1, "occurred_at": 1, "actor_id": 1}
+
+
 class CreateVehiclePayload(BaseModel):
     vin: Optional[str] = None
     make: Optional[str] = None
@@ -54,37 +110,237 @@ class PartPayload(BaseModel):
     price_etb: Optional[float] = None
 
 
-class Mutation(BaseModel):
-    op: str
-    data: Dict[str, Any]
-    client_id: str
-    client_timestamp: datetime
+def _payload_dict(payload: BaseModel) -> Dict[str, Any]:
+    # payload models are flat (no nested BaseModels), so reading __dict__ gives the
+    # same result as model_dump(exclude_none=True) without the recursive walk
+    return {k: v for k, v in payload.__dict__.items() if v is not None}
+
 
+def _stamp(data: Dict[str, Any], now: Optional[datetime] = None) -> Dict[str, Any]:
+    # set server timestamps up front so the inserted document can be echoed as-is
+    if now is None:
+        now = utc_now()
+    data["created_at"] = now
+    data["updated_at"] = now
+    return data
 
-class SyncEnvelope(BaseModel):
-    mutations: List[Mutation]
+
+# plain dotted field paths only: Mongo rejects "$..." names and empty segments
+_match_field_path = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$").match
+
+
+def _projection(fields: Optional[str], default: Optional[Dict[str, int]] = None) -> Optional[Dict[str, int]]:
+    # "a,b,c" -> {"a": 1, "b": 1, "c": 1}; _id is always returned by Mongo
+    if not fields:
+        return default
+    projection = {f: 1 for f in (f.strip() for f in fields.split(",")) if f}
+    for f in projection:
+        if _match_field_path(f) is None:
+            raise HTTPException(status_code=400, detail=f"Invalid field name: {f}")
+        # "a" together with "a.b" is a path collision Mongo rejects
+        prefix = f.rpartition(".")[0]
+        while prefix:
+            if prefix in projection:
+                raise HTTPException(status_code=400, detail=f"Field {f} overlaps with {prefix}")
+            prefix = prefix.rpartition(".")[0]
+    return projection or default
 
 
 def _serialize(doc: Dict[str, Any]):
+    # handlers hand the result straight to UTCJSONResponse (no jsonable_encoder),
+    # so only orjson-native values may remain; datetimes are encoded natively.
+    # _id and vehicle_id are the only ObjectIds in our documents, and Motor
+    # hands back a fresh dict per document, so convert them in place
     if not doc:
         return doc
-    d = dict(doc)
-    if "_id" in d:
-        d["id"] = str(d.pop("_id"))
-    # Convert nested ObjectIds if any
-    for k, v in d.items():
-        if isinstance(v, ObjectId):
-            d[k] = str(v)
-    return d
+    if "_id" in doc:
+        doc["id"] = str(doc.pop("_id"))
+    vid = doc.get("vehicle_id")
+    if vid is not None:
+        doc["vehicle_id"] = str(vid)
+    return doc
+
+
+def _coerce_vehicle_id(data: Dict[str, Any]) -> None:
+    # vehicle_id is stored as an ObjectId so it indexes and compares natively
+    vid = data.get("vehicle_id")
+    if vid is None or isinstance(vid, ObjectId):
+        return
+    try:
+        data["vehicle_id"] = ObjectId(vid)
+    except (InvalidId, TypeError):
+        raise ValueError("Invalid vehicle id")
+
+
+async def _bulk_write(collection_name: str, requests: List[Any]) -> Dict[int, str]:
+    """Run ``requests`` in one unordered bulk_write; returns error messages keyed by request index."""
+    if db is None:
+        return {j: "Database not available. Check DATABASE_URL and DATABASE_NAME environment variables." for j in range(len(requests))}
+    try:
+        # InsertOne assigns _id on its document in place, including the ones that fail
+        await db[collection_name].bulk_write(requests, ordered=False)
+    except BulkWriteError as e:
+        return {err["index"]: err.get("errmsg", "write error") for err in e.details.get("writeErrors", [])}
+    except Exception as e:
+        return {j: str(e) for j in range(len(requests))}
+    return {}
+
+
+# event_type -> vehicle status it moves the vehicle to
+_STATUS_BY_EVENT = {"dismantling": "dismantled", "scrap": "scrapped"}
+
+
+def _status_update(event: Dict[str, Any], now: datetime) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """(filter, update) for the vehicle status change implied by ``event``
+    (vehicle_id already coerced), if any."""
+    status = _STATUS_BY_EVENT.get(event.get("event_type"))
+    vid = event.get("vehicle_id")
+    if status is None or vid is None:
+        return None
+    return {"_id": vid}, {"$set": {"status": status, "updated_at": now}}
+
+
+async def _vehicle_statuses(vehicle_ids: Set[ObjectId]) -> Dict[ObjectId, Optional[str]]:
+    """Current status of the given vehicles, fetched in one query; missing ids are absent."""
+    if not vehicle_ids or db is None:
+        return {}
+    try:
+        cursor = db["vehicle"].find({"_id": {"$in": list(vehicle_ids)}}, {"_id": 1, "status": 1})
+        return {v["_id"]: v.get("status") async for v in cursor}
+    except Exception:
+        # status side-effects are best-effort; without the lookup none are queued
+        logger.exception("Could not load status of vehicles %s", sorted(map(str, vehicle_ids)))
+        return {}
+
+
+# Canonical client timestamp: UTC, millisecond precision, "Z" suffix (what
+# JavaScript's Date.toISOString() emits). This fixed-width form sorts correctly
+# as a plain string, so envelopes using it only are ordered without parsing.
+_match_canonical_timestamp = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}Z$").match
+
+
+# (field, expected type, pydantic error type, message) checked on every mutation
+_MUTATION_FIELDS = (
+    ("op", str, "string_type", "Input should be a valid string"),
+    ("data", dict, "dict_type", "Input should be a valid dictionary"),
+    ("client_id", str, "string_type", "Input should be a valid string"),
+)
+
+
+def _parse_client_timestamp(value: Any) -> datetime:
+    """Read client_timestamp the way the former Pydantic ``datetime`` field did.
+
+    Accepts ISO-8601 strings (any offset or precision; naive is read as UTC)
+    and unix timestamps as numbers or numeric strings, in seconds or, above
+    2e10, milliseconds. Raises ValueError otherwise.
+    """
+    if isinstance(value, str):
+        try:
+            ts = datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith(("Z", "z")) else value)
+            return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+        except ValueError:
+            value = float(value)  # numeric string, else ValueError propagates
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError("Input should be a valid datetime")
+    if abs(value) > 2e10:
+        value = value / 1000
+    try:
+        return datetime.fromtimestamp(value, timezone.utc)
+    except (OverflowError, OSError) as e:
+        raise ValueError(str(e))
+
+
+def _body_error(loc: Tuple[Any, ...], error_type: str, msg: str, value: Any, **ctx: Any) -> Dict[str, Any]:
+    # same shape as the errors FastAPI reports for Pydantic-validated bodies
+    error = {"type": error_type, "loc": ("body", *loc), "msg": msg, "input": value}
+    if ctx:
+        error["ctx"] = ctx
+    return error
+
+
+def _parse_mutations(body: bytes) -> List[Dict[str, Any]]:
+    """Check a sync envelope by hand instead of through Pydantic; returns its
+    mutations ordered by ``client_timestamp``.
+
+    The body must be an object whose ``mutations`` is a list of objects, each
+    with a string ``op``, an object ``data``, a string ``client_id`` and a
+    ``client_timestamp`` accepted by _parse_client_timestamp. ``op`` is not
+    checked against the known ops: unknown ops are reported per mutation as
+    "ignored". Failures raise RequestValidationError, so clients get FastAPI's
+    usual 422 list-of-errors body.
+    """
+    try:
+        envelope = orjson.loads(body)
+    except orjson.JSONDecodeError as e:
+        raise RequestValidationError([_body_error((e.pos,), "json_invalid", "JSON decode error", {}, error=e.msg)])
+    if not isinstance(envelope, dict):
+        raise RequestValidationError([_body_error((), "model_attributes_type", "Input should be a valid dictionary or object to extract fields from", envelope)])
+    if "mutations" not in envelope:
+        raise RequestValidationError([_body_error(("mutations",), "missing", "Field required", envelope)])
+    mutations = envelope["mutations"]
+    if not isinstance(mutations, list):
+        raise RequestValidationError([_body_error(("mutations",), "list_type", "Input should be a valid list", mutations)])
+
+    errors: List[Dict[str, Any]] = []
+    for i, m in enumerate(mutations):
+        if not isinstance(m, dict):
+            errors.append(_body_error(("mutations", i), "model_attributes_type", "Input should be a valid dictionary or object to extract fields from", m))
+            continue
+        for field, expected, error_type, msg in _MUTATION_FIELDS:
+            if field not in m:
+                errors.append(_body_error(("mutations", i, field), "missing", "Field required", m))
+            elif not isinstance(m[field], expected):
+                errors.append(_body_error(("mutations", i, field), error_type, msg, m[field]))
+        if "client_timestamp" not in m:
+            errors.append(_body_error(("mutations", i, "client_timestamp"), "missing", "Field required", m))
+    if errors:
+        raise RequestValidationError(errors)
+
+    # client_timestamp is only used for ordering: when every mutation uses the
+    # canonical form, string order is time order and nothing is parsed
+    if all(isinstance(m["client_timestamp"], str) and _match_canonical_timestamp(m["client_timestamp"]) for m in mutations):
+        return sorted(mutations, key=itemgetter("client_timestamp"))
+    keys: List[datetime] = []
+    for i, m in enumerate(mutations):
+        try:
+            keys.append(_parse_client_timestamp(m["client_timestamp"]))
+        except ValueError:
+            errors.append(_body_error(
+                ("mutations", i, "client_timestamp"),
+                "datetime_parsing",
+                "Input should be a valid datetime",
+                m["client_timestamp"],
+            ))
+    if errors:
+        raise RequestValidationError(errors)
+    return [mutations[i] for i in sorted(range(len(mutations)), key=keys.__getitem__)]
 
 
 @app.get("/")
-def read_root():
-    return {"message": "BMW ELV Tracking Backend is running"}
+async def read_root():
+    return UTCJSONResponse(content={"message": "BMW ELV Tracking Backend is running"})
+
+
+# env lookups and the collection listing are cached so frequent health probes
+# do not hit the environment and Mongo on every call
+_DATABASE_URL_SET = bool(os.getenv("DATABASE_URL"))
+_DATABASE_NAME_SET = bool(os.getenv("DATABASE_NAME"))
+_COLLECTIONS_TTL = 5  # seconds
+_collections_cache: Tuple[int, List[str]] = (-1, [])
+
+
+async def _collections() -> List[str]:
+    # functools.lru_cache cannot cache coroutines, so keep one (bucket, names)
+    # pair; failures are not cached and are retried on the next probe
+    global _collections_cache
+    bucket = int(time.time()) // _COLLECTIONS_TTL
+    if _collections_cache[0] != bucket:
+        _collections_cache = (bucket, await db.list_collection_names())
+    return _collections_cache[1]
 
 
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -100,7 +356,7 @@ def test_database():
             response["database_name"] = db.name if hasattr(db, "name") else "✅ Connected"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
+                collections = await _collections()
                 response["collections"] = collections[:10]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
@@ -110,95 +366,237 @@ def test_database():
     except Exception as e:
         response["database"] = f"❌ Error: {str(e)[:80]}"
 
-    response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
-    response["database_name"] = "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set"
-    return response
+    response["database_url"] = "✅ Set" if _DATABASE_URL_SET else "❌ Not Set"
+    response["database_name"] = "✅ Set" if _DATABASE_NAME_SET else "❌ Not Set"
+    return UTCJSONResponse(content=response)
 
 
 # ---------- Vehicles ----------
 @app.post("/api/vehicles")
-def create_vehicle(payload: CreateVehiclePayload):
-    data = payload.model_dump(exclude_none=True)
-    inserted_id = create_document("vehicle", data)
-    vehicle = db["vehicle"].find_one({"_id": ObjectId(inserted_id)})
-    return _serialize(vehicle)
+async def create_vehicle(payload: CreateVehiclePayload):
+    # one dict end to end: create_document stamps it and insert_one adds _id
+    data = _payload_dict(payload)
+    try:
+        await create_document("vehicle", data)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Vehicle with this VIN already exists")
+    return UTCJSONResponse(content=_serialize(data))
 
 
 @app.get("/api/vehicles")
-def list_vehicles(
+async def list_vehicles(
     status: Optional[str] = Query(None, description="Filter by status"),
     limit: int = Query(50, ge=1, le=200),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
 ):
     filt: Dict[str, Any] = {}
     if status:
         filt["status"] = status
-    docs = get_documents("vehicle", filt, limit)
-    return [_serialize(d) for d in docs]
+    docs = await get_documents("vehicle", filt, limit, _projection(fields))
+    return UTCJSONResponse(content=[_serialize(d) for d in docs])
 
 
 @app.get("/api/vehicles/{vehicle_id}/history")
-def get_vehicle_history(vehicle_id: str):
+async def get_vehicle_history(
+    vehicle_id: str,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+):
     try:
         vids = ObjectId(vehicle_id)
-    except Exception:
+    except (InvalidId, TypeError):
         raise HTTPException(status_code=400, detail="Invalid vehicle id")
-    events = db["event"].find({"vehicle_id": str(vids)}).sort("occurred_at", 1)
-    return [_serialize(e) for e in events]
+    projection = _projection(fields, HISTORY_FIELDS)
+    events = db["event"].find({"vehicle_id": vids}, projection).sort("occurred_at", 1)
+    return UTCJSONResponse(content=[_serialize(e) async for e in events])
+
+
+def _vehicle_id_or_400(data: Dict[str, Any]) -> None:
+    try:
+        _coerce_vehicle_id(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 # ---------- Events ----------
 @app.post("/api/events")
-def log_event(payload: EventPayload):
-    data = payload.model_dump(exclude_none=True)
-    # default occurred_at to now if missing
-    data.setdefault("occurred_at", datetime.now(timezone.utc))
-    inserted_id = create_document("event", data)
-    ev = db["event"].find_one({"_id": ObjectId(inserted_id)})
-    # side-effect: update vehicle status for certain events when possible
-    if data.get("vehicle_id") and data.get("event_type") in {"dismantling", "scrap"}:
-        db["vehicle"].update_one(
-            {"_id": ObjectId(data["vehicle_id"])},
-            {"$set": {"status": "dismantled" if data["event_type"] == "dismantling" else "scrapped", "updated_at": datetime.now(timezone.utc)}},
-        )
-    return _serialize(ev)
+async def log_event(payload: EventPayload):
+    data = _payload_dict(payload)
+    _vehicle_id_or_400(data)
+    # default occurred_at to now if missing; stamped here (not in create_document)
+    # because the status update below needs the same updated_at
+    now = utc_now()
+    occurred_at = data.setdefault("occurred_at", now)
+    if occurred_at.tzinfo is not None:
+        # store and echo in UTC, the form history later returns it in
+        occurred_at = occurred_at.astimezone(timezone.utc)
+    # BSON keeps milliseconds only; trim so the echo equals what GET returns
+    data["occurred_at"] = to_bson_precision(occurred_at)
+    _stamp(data, now)
+    await create_document("event", data)
+    # side-effect: update vehicle status for certain events when possible.
+    # Only applied once the event is stored, and best-effort like in sync: the
+    # event is already persisted, so a failed update must not make the client
+    # retry (and duplicate) it
+    update = _status_update(data, now)
+    if update is not None:
+        try:
+            await db["vehicle"].update_one(*update)
+        except Exception:
+            logger.exception("Could not update status of vehicle %s", data["vehicle_id"])
+    return UTCJSONResponse(content=_serialize(data))
 
 
 # ---------- Parts ----------
 @app.post("/api/parts")
-def register_part(payload: PartPayload):
-    data = payload.model_dump(exclude_none=True)
-    inserted_id = create_document("part", data)
-    part = db["part"].find_one({"_id": ObjectId(inserted_id)})
-    return _serialize(part)
+async def register_part(payload: PartPayload):
+    data = _payload_dict(payload)
+    _vehicle_id_or_400(data)
+    await create_document("part", data)
+    return UTCJSONResponse(content=_serialize(data))
 
 
 # ---------- Sync (Offline batch) ----------
-@app.post("/api/sync")
-def sync(envelope: SyncEnvelope):
-    results: List[Dict[str, Any]] = []
-    for m in sorted(envelope.mutations, key=lambda x: x.client_timestamp):
-        op = m.op
-        data = m.data
-        try:
-            if op == "createVehicle":
-                inserted_id = create_document("vehicle", data)
-                results.append({"op": op, "status": "ok", "id": inserted_id})
-            elif op == "logEvent":
-                data.setdefault("occurred_at", datetime.now(timezone.utc))
-                inserted_id = create_document("event", data)
-                results.append({"op": op, "status": "ok", "id": inserted_id})
-            elif op == "registerPart":
-                inserted_id = create_document("part", data)
-                results.append({"op": op, "status": "ok", "id": inserted_id})
-            else:
-                results.append({"op": op, "status": "ignored", "reason": "unknown op"})
-        except Exception as e:
-            results.append({"op": op, "status": "error", "error": str(e)})
-    return {"results": results, "server_time": datetime.now(timezone.utc)}
+def _prepare_event(data: Dict[str, Any], now: datetime) -> None:
+    _coerce_vehicle_id(data)
+    data.setdefault("occurred_at", now)
+
+
+def _prepare_part(data: Dict[str, Any], now: datetime) -> None:
+    _coerce_vehicle_id(data)
+
+
+# op -> (target collection, optional in-place preparation of the document,
+# called with the envelope's server time; raising ValueError marks that
+# mutation as an error)
+_SYNC_HANDLERS = {
+    "createVehicle": ("vehicle", None),
+    "logEvent": ("event", _prepare_event),
+    "registerPart": ("part", _prepare_part),
+}
+
+
+# sync reads the raw body, so FastAPI cannot derive its schema; publish the
+# schemas.py contract by hand (Mutation has no nested models to reference).
+# op is any string here: unknown ops are reported as "ignored", not rejected
+_MUTATION_SCHEMA = Mutation.model_json_schema()
+_MUTATION_SCHEMA["properties"]["op"] = {
+    "title": "Op",
+    "type": "string",
+    "description": "createVehicle, logEvent or registerPart; other ops are ignored",
+}
+_SYNC_REQUEST_BODY = {
+    "required": True,
+    "content": {
+        "application/json": {
+            "schema": {
+                "title": "SyncEnvelope",
+                "type": "object",
+                "required": ["mutations"],
+                "properties": {
+                    "mutations": {"title": "Mutations", "type": "array", "items": _MUTATION_SCHEMA},
+                },
+            },
+        },
+    },
+}
+# same 422 entry FastAPI adds to validated routes; HTTPValidationError is in
+# the components because the other routes declare parameters
+_SYNC_RESPONSES = {
+    422: {
+        "description": "Validation Error",
+        "content": {"application/json": {"schema": {"$ref": REF_PREFIX + "HTTPValidationError"}}},
+    },
+}
+
+
+@app.post("/api/sync", openapi_extra={"requestBody": _SYNC_REQUEST_BODY}, responses=_SYNC_RESPONSES)
+async def sync(request: Request):
+    mutations = _parse_mutations(await request.body())
+    results: List[Optional[Dict[str, Any]]] = [None] * len(mutations)
+    # every mutation in the envelope shares one server receive time
+    server_now = utc_now()
+    # one bulk_write per collection; events go first so that vehicle status
+    # updates ride along with the vehicle inserts, and only for logged events
+    requests: Dict[str, List[Any]] = {"event": [], "vehicle": [], "part": []}
+    positions: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {"event": [], "vehicle": [], "part": []}
+    for i, m in enumerate(mutations):
+        op = m["op"]
+        data = m["data"]
+        spec = _SYNC_HANDLERS.get(op)
+        if spec is None:
+            results[i] = {"op": op, "status": "ignored", "reason": "unknown op"}
+            continue
+        coll, prepare = spec
+        if prepare is not None:
+            try:
+                prepare(data, server_now)
+            except ValueError as e:
+                results[i] = {"op": op, "status": "error", "error": str(e)}
+                continue
+        requests[coll].append(InsertOne(_stamp(data, server_now)))
+        positions[coll].append((i, data))
+
+    # one lookup for every vehicle a status-changing event points at, instead
+    # of finding out per event whether the vehicle exists and needs the update
+    current = await _vehicle_statuses({
+        doc["vehicle_id"]
+        for _, doc in positions["event"]
+        if doc.get("vehicle_id") is not None and doc.get("event_type") in _STATUS_BY_EVENT
+    })
+    # vehicle_id -> last logged status-changing event; mutations are in client
+    # order and the bulk_write is unordered, so each vehicle gets one update
+    latest: Dict[ObjectId, Dict[str, Any]] = {}
+
+    for coll, ops in requests.items():
+        if not ops:
+            continue
+        errors = await _bulk_write(coll, ops)
+        # status updates queued after the inserts have no mutation position, so a
+        # failed update never turns an already logged event into an error
+        for j, (i, doc) in enumerate(positions[coll]):
+            op = mutations[i]["op"]
+            if j in errors:
+                results[i] = {"op": op, "status": "error", "error": errors[j]}
+                continue
+            results[i] = {"op": op, "status": "ok", "id": str(doc["_id"])}
+            if coll == "event" and doc.get("vehicle_id") in current and doc.get("event_type") in _STATUS_BY_EVENT:
+                latest[doc["vehicle_id"]] = doc
+        if coll == "event":
+            for vid, doc in latest.items():
+                if current[vid] != _STATUS_BY_EVENT[doc["event_type"]]:
+                    requests["vehicle"].append(UpdateOne(*_status_update(doc, server_now)))
+    return UTCJSONResponse(content={"results": results, "server_time": server_now})
+
+
+# ---------- Warm-up ----------
+def _warm_up() -> None:
+    # build schemas and run each validator once at import, so on a cold start
+    # neither the first request nor the first /docs hit pays for it
+    for model in (CreateVehiclePayload, EventPayload, PartPayload):
+        model.model_rebuild()
+        model.model_json_schema()
+    CreateVehiclePayload()
+    EventPayload(event_type="note")
+    PartPayload(name="warm-up")
+    app.openapi()
+
+
+_warm_up()
 
 
 if __name__ == "__main__":
     import uvicorn
 
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # workers need an import string rather than the app object; access logs
+    # are off since per-request logging is measurable at high request rates
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        log_level="warning",
+        access_log=False,
+    )
@@ -0,0 +1,31 @@
+"""
+One-off migration: store vehicle_id as an ObjectId
+
+Events and parts used to keep vehicle_id as its 24-char hex string. The API now
+writes and queries it as a native ObjectId, so convert existing documents.
+Run once with the same DATABASE_URL / DATABASE_NAME as the API:
+
+    python migrate_vehicle_ids.py
+"""
+
+import asyncio
+
+from database import db
+
+# only touch well-formed hex ids; $toObjectId fails on anything else
+LEGACY_FILTER = {"vehicle_id": {"$type": "string", "$regex": "^[0-9a-fA-F]{24}$"}}
+
+
+async def migrate():
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+    for collection_name in ("event", "part"):
+        result = await db[collection_name].update_many(
+            LEGACY_FILTER,
+            [{"$set": {"vehicle_id": {"$toObjectId": "$vehicle_id"}}}],
+        )
+        print(f"{collection_name}: converted {result.modified_count} documents")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())